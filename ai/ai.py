@@ -1,13 +1,15 @@
 from openai import OpenAI
 import openai
+import httpx
 import os
 from dotenv import load_dotenv
 import db
-import joblib
-import pandas as pd
 import numpy as np
 import logging
-import traceback
+import functools
+import threading
+from utils.batching import Batcher
+from .inference import NUMERIC_FEATURES, load_models, score_features
 
 load_dotenv()
 
@@ -17,26 +19,104 @@ logger = logging.getLogger(__name__)
 ## AI CHAT
 model = os.getenv('MODEL')
 api = os.getenv('GROQ_API_KEY')
-client = OpenAI(base_url=os.getenv("BASE_URL_GROQ"), api_key=api)
-
-# Load the trained model and encoder once when module is imported
-xgb_model = None
-ohe_encoder = None
-
-try:
-    xgb_model = joblib.load('ai/Models/xgboost_model.pkl')
-    ohe_encoder = joblib.load('ai/Models/onehot_encoder.pkl')
-    logger.info("✅ ML models loaded successfully")
-    print("✅ ML models loaded successfully")
-except FileNotFoundError as e:
-    logger.error(f"⚠️  ML model files not found: {e}")
-    print(f"⚠️  Warning: ML model files not found - {e}")
-except Exception as e:
-    logger.error(f"⚠️  Could not load ML models: {e}")
-    print(f"⚠️  Warning: Could not load ML models - {e}")
-
-def get_explanation(_id):
-    """Get AI explanation for user query with comprehensive error handling"""
+BASE_URL_GROQ = os.getenv("BASE_URL_GROQ")
+# One shared keep-alive pool for all /chat requests; HTTP/2 lets concurrent
+# requests multiplex over the same TLS connection. get_explanation retries
+# itself, so the client's own retries are disabled to keep a request from
+# holding a worker through nine attempts.
+client = OpenAI(
+    base_url=BASE_URL_GROQ,
+    api_key=api,
+    max_retries=0,
+    http_client=openai.DefaultHttpxClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+        timeout=httpx.Timeout(30.0, connect=5.0),
+    ),
+)
+
+@functools.cache
+def _load_models():
+    """
+    Load the trained model and encoder
+
+    Returns a dict with the model, encoder, booster, the one-hot row for each
+    known LANDCOVER category and the full feature column order, or None if
+    the models could not be loaded. pandas and joblib are only imported here
+    so they stay out of the server's startup path.
+    """
+    import pandas as pd
+
+    try:
+        xgb_model, ohe_encoder = load_models()
+        booster = xgb_model.get_booster()
+        # Batches are at most MAX_BATCH rows; a single thread avoids OpenMP
+        # fork/join overhead that outweighs the tree walk at this size
+        booster.set_param({'nthread': 1})
+
+        # Encode every known LANDCOVER category once
+        landcover_features = list(ohe_encoder.get_feature_names_out(['LANDCOVER']))
+        landcover_categories = ohe_encoder.categories_[0]
+        landcover_encoded = ohe_encoder.transform(pd.DataFrame({'LANDCOVER': landcover_categories}))
+        ohe_cache = {
+            category: landcover_encoded[i].astype(np.float32)
+            for i, category in enumerate(landcover_categories)
+        }
+
+        logger.info("✅ ML models loaded successfully")
+        print("✅ ML models loaded successfully")
+        return {
+            'model': xgb_model,
+            'encoder': ohe_encoder,
+            'booster': booster,
+            'ohe_cache': ohe_cache,
+            # Full model input column order
+            'feature_cols': [*NUMERIC_FEATURES, *landcover_features],
+        }
+    except FileNotFoundError as e:
+        logger.error(f"⚠️  ML model files not found: {e}")
+        print(f"⚠️  Warning: ML model files not found - {e}")
+    except Exception as e:
+        logger.error(f"⚠️  Could not load ML models: {e}")
+        print(f"⚠️  Warning: Could not load ML models - {e}")
+    return None
+
+# functools.cache does not stop concurrent first calls from each loading the
+# models, so the first load runs under a lock
+_models_lock = threading.Lock()
+
+def _get_models():
+    """Return the loaded models (see _load_models), loading them on first use"""
+    with _models_lock:
+        return _load_models()
+
+def models_loaded():
+    """Return True if the ML models are available, loading them if needed"""
+    return _get_models() is not None
+
+def stream_text(stream):
+    """Yield the non-empty text deltas of a streamed chat completion"""
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+def _stream_response(stream, first_chunk, chunks):
+    """Yield the response text, closing the upstream stream once finished or abandoned"""
+    try:
+        yield first_chunk
+        yield from chunks
+    finally:
+        stream.close()
+
+def get_explanation(_id, user_message):
+    """
+    Get AI explanation for user query with comprehensive error handling
+
+    The stored conversation is sent with user_message appended. Returns an
+    iterator over the streamed response text, or an "Error: ..." string if
+    no response could be started; the caller saves both messages once the
+    stream is consumed.
+    """
     try:
         # Validate input
         if not _id:
@@ -50,57 +130,51 @@ def get_explanation(_id):
             logger.error(f"Database error in get_explanation: {db_error}")
             return "Error: Could not retrieve conversation history"
         
-        # Handle case where no conversation exists yet
+        # Start a new conversation with the system prompt if none exists yet
         if not document or document == False:
-            logger.warning(f"No conversation found for ID: {_id}")
-            return "Error: No conversation found. Please try again."
-        
-        if not isinstance(document, list) or len(document) == 0:
+            logger.info(f"Starting new conversation for ID: {_id}")
+            conversation = [{'role': 'system', 'content': db.SYSTEM_PROMPT}]
+        elif not isinstance(document, list) or len(document) == 0:
             logger.error(f"Invalid document format from database: {type(document)}")
             return "Error: Invalid conversation data"
-        
-        # Extract conversation
-        try:
-            conversation = document[0].get('conversation', [])
-            if not conversation:
-                logger.warning(f"Empty conversation for ID: {_id}")
-                return "Error: No conversation messages found"
-        except (KeyError, IndexError, AttributeError) as e:
-            logger.error(f"Error extracting conversation: {e}")
-            return "Error: Invalid conversation format"
+        else:
+            # Extract conversation
+            try:
+                conversation = document[0].get('conversation', [])
+                if not conversation:
+                    logger.warning(f"Empty conversation for ID: {_id}")
+                    return "Error: No conversation messages found"
+            except (KeyError, IndexError, AttributeError) as e:
+                logger.error(f"Error extracting conversation: {e}")
+                return "Error: Invalid conversation format"
         
         # Clean up the conversation - ensure all content fields are strings
-        cleaned_conversation = []
         try:
-            for i, msg in enumerate(conversation):
-                if not isinstance(msg, dict):
-                    logger.warning(f"Invalid message format at index {i}: {type(msg)}")
-                    continue
-                
-                if 'content' in msg and msg['content'] is not None and 'role' in msg:
-                    cleaned_conversation.append({
-                        'role': str(msg['role']),
-                        'content': str(msg['content'])
-                    })
-                else:
-                    logger.warning(f"Message missing content/role at index {i}: {msg}")
+            cleaned_conversation = [
+                {'role': str(msg['role']), 'content': str(msg['content'])}
+                for msg in conversation
+                if isinstance(msg, dict) and msg.get('content') is not None and 'role' in msg
+            ]
         except Exception as e:
             logger.error(f"Error cleaning conversation: {e}")
             return "Error: Could not process conversation"
         
-        if not cleaned_conversation:
-            logger.warning("No valid messages in conversation")
-            return "Error: No valid messages in conversation"
+        if len(cleaned_conversation) != len(conversation):
+            logger.warning(f"Skipped {len(conversation) - len(cleaned_conversation)} invalid messages for user {_id}")
         
-        logger.info(f"Processing {len(cleaned_conversation)} messages for user {_id}")
+        # Add the new user message, which is not saved yet
+        cleaned_conversation.append(user_message)
         
         # Validate API configuration
         if not model or not api or not client:
             logger.error("AI API configuration missing")
             return "Error: AI service not configured"
         
-        logger.info(f"Using model: {model}")
-        logger.info(f"API endpoint: {os.getenv('BASE_URL_GROQ')}")
+        # Only build the log strings when INFO records will be emitted
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Processing {len(cleaned_conversation)} messages for user {_id}")
+            logger.info(f"Using model: {model}")
+            logger.info(f"API endpoint: {BASE_URL_GROQ}")
         
         # Make API call with timeout and retry logic
         max_retries = 3
@@ -110,20 +184,26 @@ def get_explanation(_id):
                     model=model, 
                     temperature=0.3, 
                     messages=cleaned_conversation,
-                    timeout=30  # 30 second timeout
+                    stream=True
                 )
                 
-                if response and response.choices and len(response.choices) > 0:
-                    ai_response = response.choices[0].message.content
-                    if ai_response:
-                        logger.info(f"AI response generated successfully for user {_id}")
-                        return ai_response
-                    else:
-                        logger.error("Empty AI response")
-                        return "Error: AI returned empty response"
-                else:
-                    logger.error("Invalid AI response structure")
-                    return "Error: Invalid AI response"
+                # Wait for the first token so failures before any output can
+                # still be retried or reported as an error
+                chunks = stream_text(response)
+                try:
+                    first_chunk = next(chunks, None)
+                except Exception:
+                    # Release the stream before the attempt is retried
+                    response.close()
+                    raise
+                if first_chunk is None:
+                    response.close()
+                    logger.error("Empty AI response")
+                    return "Error: AI returned empty response"
+                
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info(f"AI response stream started for user {_id}")
+                return _stream_response(response, first_chunk, chunks)
                     
             except openai.APITimeoutError as e:
                 logger.warning(f"AI API timeout on attempt {attempt + 1}: {e}")
@@ -134,19 +214,108 @@ def get_explanation(_id):
                 if attempt == max_retries - 1:
                     return f"Error: AI service error - {str(e)}"
             except Exception as e:
-                logger.error(f"Unexpected AI error on attempt {attempt + 1}: {e}")
-                logger.error(f'AI Stack trace: {traceback.format_exc()}')
+                logger.exception(f"Unexpected AI error on attempt {attempt + 1}: {e}")
                 if attempt == max_retries - 1:
                     return f"Error: AI service unavailable - {str(e)}"
         
         return "Error: AI service failed after multiple attempts"
 
     except Exception as e:
-        logger.error(f"Unexpected error in get_explanation: {e}")
-        logger.error(f'Stack trace: {traceback.format_exc()}')
+        logger.exception(f"Unexpected error in get_explanation: {e}")
         return f"Error: {str(e)}"
 
-## Fire Flammability Prediction Function
+## Fire Flammability Prediction
+
+# Hardcoded values for Kathmandu, Nepal
+KATHMANDU_DEFAULTS = {
+    'ELEVATION': 1400.0,  # Kathmandu valley elevation ~1400m
+    'SLOPE': 8.5,         # Gentle slopes in Kathmandu valley
+    'LANDCOVER': 'Others', # Mixed urban/agricultural land
+    'WS2M': 2.1           # Average wind speed in Kathmandu
+}
+
+# Valid range and fallback value for each sensor-driven feature:
+# (feature column, low, high, default)
+SENSOR_RANGES = [
+    ('T2M', -50.0, 60.0, 25.0),          # Temperature °C
+    ('RH2M', 0.0, 100.0, 50.0),          # Humidity %
+    ('ssm(m³/m³)', 0.0, 1.0, 0.15),      # Soil moisture, 0-100% scaled to m³/m³
+]
+
+# Micro-batching: pending predictions are scored together once MAX_BATCH
+# rows are queued or BATCH_TIMEOUT seconds after the first one arrived
+MAX_BATCH = 64
+BATCH_TIMEOUT = 0.005
+
+# Lower probability bound of risk levels 1-4; a probability's level is the
+# number of thresholds it reaches
+RISK_THRESHOLDS = np.array([0.2, 0.4, 0.6, 0.8])
+
+class BatchPredictor(Batcher):
+    """
+    Collects prediction requests from concurrent callers and scores them with
+    a single inplace_predict call on a background thread.
+
+    submit() returns a Future resolving to (risk_level, fire_probability).
+    """
+
+    thread_name = "flammability-batcher"
+
+    def __init__(self, max_batch=MAX_BATCH, timeout=BATCH_TIMEOUT):
+        super().__init__(max_batch, timeout)
+
+    def _setup(self):
+        # Input matrix allocated once and owned by this thread; each batch
+        # fills the leading rows
+        models = _get_models()
+        buffer = np.empty((self.max_batch, len(models['feature_cols'])), dtype=np.float32)
+        return models, buffer
+
+    def _process(self, batch, state):
+        models, buffer = state
+        self._score(batch, buffer[:len(batch)], models)
+
+    def _score(self, batch, features, models):
+        rows = [model_input for model_input, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            # Fill the float32 matrix by position; inplace_predict skips the
+            # DataFrame/DMatrix construction entirely
+            n_numeric = len(NUMERIC_FEATURES)
+            for i, row in enumerate(rows):
+                features[i, :n_numeric] = (
+                    row['ELEVATION'], row['SLOPE'], row['T2M'],
+                    row['RH2M'], row['WS2M'], row['ssm']
+                )
+                features[i, n_numeric:] = models['ohe_cache'][row['LANDCOVER']]
+
+            # Replace out-of-range (or NaN) sensor values with defaults for
+            # the whole batch at once
+            for feature, low, high, default in SENSOR_RANGES:
+                values = features[:, NUMERIC_FEATURES.index(feature)]
+                out_of_range = ~((values >= low) & (values <= high))
+                if out_of_range.any():
+                    logger.warning(f"{feature} out of range in {int(out_of_range.sum())} rows: {values[out_of_range].tolist()}, using default {default}")
+                    values[out_of_range] = default
+
+            # Score the whole batch at once
+            fire_probabilities = score_features(models['booster'], features)
+            risk_levels = np.searchsorted(RISK_THRESHOLDS, fire_probabilities, side='right')
+
+            for future, risk_level, fire_probability in zip(futures, risk_levels.tolist(), fire_probabilities.tolist()):
+                future.set_result((risk_level, fire_probability))
+        except Exception as e:
+            logger.error(f"Error scoring batch of {len(batch)} rows: {e}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+
+predictor = BatchPredictor()
+
+# (input key, risk level) of the most recent prediction; sensors often
+# report the same reading back-to-back
+_last_prediction = (None, 0)
+
 def predict_flammability(data):
     """
     Predict fire flammability using trained XGBoost model with comprehensive error handling
@@ -170,42 +339,29 @@ def predict_flammability(data):
             return 0
         
         # Check if models are loaded
-        if xgb_model is None or ohe_encoder is None:
+        if not models_loaded():
             logger.warning("ML models not loaded, returning default prediction: 0")
             return 0
         
-        # Hardcoded values for Kathmandu, Nepal
-        KATHMANDU_DEFAULTS = {
-            'ELEVATION': 1400.0,  # Kathmandu valley elevation ~1400m
-            'SLOPE': 8.5,         # Gentle slopes in Kathmandu valley
-            'LANDCOVER': 'Others', # Mixed urban/agricultural land
-            'WS2M': 2.1           # Average wind speed in Kathmandu
-        }
-        
         # Safely extract and validate sensor data
         try:
             temperature = float(data.get('temperature', 25.0))
             humidity = float(data.get('humidity', 50.0))
             soil_moisture_raw = float(data.get('soil_moisture', 15.0))
-            
-            # Validate ranges
-            if not -50 <= temperature <= 60:
-                logger.warning(f"Temperature out of range: {temperature}°C, using default")
-                temperature = 25.0
-            
-            if not 0 <= humidity <= 100:
-                logger.warning(f"Humidity out of range: {humidity}%, using default")
-                humidity = 50.0
-            
-            if not 0 <= soil_moisture_raw <= 100:
-                logger.warning(f"Soil moisture out of range: {soil_moisture_raw}%, using default")
-                soil_moisture_raw = 15.0
-                
+            # Out-of-range values are replaced per batch in BatchPredictor
         except (ValueError, TypeError) as e:
             logger.error(f"Error parsing sensor data: {e}")
             logger.error(f"Sensor data received: {data}")
             return 0
         
+        # Reuse the previous result when the rounded reading is unchanged
+        global _last_prediction
+        input_key = (round(temperature, 1), round(humidity, 0), round(soil_moisture_raw, 0))
+        last_key, last_risk = _last_prediction
+        if input_key == last_key:
+            logger.debug("flam unchanged reading, reusing risk=%d", last_risk)
+            return last_risk
+        
         # Map sensor data to model features
         model_input = {
             'ELEVATION': KATHMANDU_DEFAULTS['ELEVATION'],
@@ -217,92 +373,22 @@ def predict_flammability(data):
             'ssm': soil_moisture_raw / 100.0  # Convert to m³/m³ (0-1 range)
         }
         
-        logger.info(f"🔥 Predicting flammability for Kathmandu:")
-        logger.info(f"   🌡️  Temperature: {model_input['T2M']}°C")
-        logger.info(f"   💧 Humidity: {model_input['RH2M']}%")
-        logger.info(f"   🌱 Soil Moisture: {model_input['ssm']:.3f}")
-        logger.info(f"   📍 Location: {model_input['ELEVATION']}m elevation, {model_input['SLOPE']}° slope")
-        logger.info(f"   🌿 Land Cover: {model_input['LANDCOVER']}")
-        
-        # Create DataFrame from input data
+        # Make prediction through the shared micro-batcher
         try:
-            input_data = pd.DataFrame({
-                'ELEVATION': [model_input['ELEVATION']],
-                'SLOPE': [model_input['SLOPE']],
-                'LANDCOVER': [model_input['LANDCOVER']],
-                'T2M': [model_input['T2M']],
-                'RH2M': [model_input['RH2M']],
-                'WS2M': [model_input['WS2M']],
-                'ssm(m³/m³)': [model_input['ssm']]
-            })
-        except Exception as e:
-            logger.error(f"Error creating input DataFrame: {e}")
-            return 0
-        
-        # Preprocess the data: One-hot encode 'LANDCOVER'
-        try:
-            landcover_data = input_data[['LANDCOVER']]
-            landcover_encoded = ohe_encoder.transform(landcover_data)
-            
-            # Create DataFrame from encoded features
-            feature_names = ohe_encoder.get_feature_names_out(['LANDCOVER'])
-            landcover_encoded_df = pd.DataFrame(
-                landcover_encoded, 
-                columns=feature_names, 
-                index=input_data.index
-            )
-            
-            # Combine processed data
-            processed_data = input_data.drop('LANDCOVER', axis=1).reset_index(drop=True)
-            processed_data = pd.concat([processed_data, landcover_encoded_df], axis=1)
-            
-        except Exception as e:
-            logger.error(f"Error preprocessing data: {e}")
-            return 0
-        
-        # Make prediction
-        try:
-            prediction = xgb_model.predict(processed_data)[0]
-            prediction_proba = xgb_model.predict_proba(processed_data)[0]
-            
-            # Get probability of fire (class 1)
-            fire_probability = prediction_proba[1] if len(prediction_proba) > 1 else prediction_proba[0]
-            
-            # Convert probability to risk level (0-4)
-            if fire_probability >= 0.8:
-                risk_level = 4  # Extreme Risk
-                risk_emoji = "🔴"
-                risk_text = "Extreme Risk"
-            elif fire_probability >= 0.6:
-                risk_level = 3  # High Risk
-                risk_emoji = "🟠"
-                risk_text = "High Risk"
-            elif fire_probability >= 0.4:
-                risk_level = 2  # Moderate Risk
-                risk_emoji = "🟡"
-                risk_text = "Moderate Risk"
-            elif fire_probability >= 0.2:
-                risk_level = 1  # Low Risk
-                risk_emoji = "🟢"
-                risk_text = "Low Risk"
-            else:
-                risk_level = 0  # No Risk
-                risk_emoji = "🔵"
-                risk_text = "No Risk"
+            risk_level, fire_probability = predictor.submit(model_input).result()
             
-            # Log prediction results
-            logger.info(f"   🎯 Prediction: {risk_emoji} {risk_text} (Level {risk_level})")
-            logger.info(f"   📊 Fire Probability: {fire_probability:.2%}")
+            # %-style arguments are only formatted when DEBUG is enabled
+            logger.debug("flam t=%.1f h=%.1f ssm=%.3f risk=%d p=%.3f",
+                         temperature, humidity, model_input['ssm'], risk_level, fire_probability)
             
+            _last_prediction = (input_key, risk_level)
             return risk_level
             
         except Exception as e:
-            logger.error(f"Error making prediction: {e}")
-            logger.error(f'Prediction Stack trace: {traceback.format_exc()}')
+            logger.exception(f"Error making prediction: {e}")
             return 0
         
     except Exception as e:
-        logger.error(f"❌ Unexpected error in fire prediction: {e}")
+        logger.exception(f"❌ Unexpected error in fire prediction: {e}")
         logger.error(f"   📊 Sensor data received: {data}")
-        logger.error(f'Stack trace: {traceback.format_exc()}')
         return 0  # Default to no fire risk on error
\ No newline at end of file
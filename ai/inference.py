@@ -1,31 +1,58 @@
-import joblib
-import pandas as pd
+from typing import TYPE_CHECKING
+
 import numpy as np
 
-model = joblib.load('Models/xgboost_model.pkl')
-ohe = joblib.load('Models/onehot_encoder.pkl')
+if TYPE_CHECKING:
+    # pandas is only needed at runtime by callers that build the DataFrame
+    import pandas as pd
+
+# Numeric model features in training order; the one-hot LANDCOVER columns follow
+NUMERIC_FEATURES = ['ELEVATION', 'SLOPE', 'T2M', 'RH2M', 'WS2M', 'ssm(m³/m³)']
+
+def load_models(models_dir='ai/Models'):
+    """Load the trained XGBoost model and the LANDCOVER one-hot encoder"""
+    import joblib
+
+    model = joblib.load(f'{models_dir}/xgboost_model.pkl')
+    ohe = joblib.load(f'{models_dir}/onehot_encoder.pkl')
+    return model, ohe
+
+def score_features(booster, features):
+    """
+    Score a float32 feature matrix in one inplace_predict call and return
+    the fire probability of every row
+    """
+    prediction_proba = booster.inplace_predict(features)
+    # Binary models return the fire probability directly, multi-class ones a column per class
+    return prediction_proba[:, 1] if prediction_proba.ndim > 1 else prediction_proba
 
-new_data = pd.DataFrame({
-    'ELEVATION': [2997.0, 2000, 500],
-    'SLOPE': [42.94040, 25, 5],
-    'LANDCOVER': ['Forest', 'Grassland', 'Others'],
-    'T2M': [-5.73, 15, 25],
-    'RH2M': [35.90, 60, 40],
-    'WS2M': [1.45, 3, 1],
-    'ssm(m³/m³)': [0.151760	, 0.15, 0.05]
-})
+def predict_batch(df: "pd.DataFrame", model, ohe) -> np.ndarray:
+    """Return the fire probability for every row of df, encoding and scoring them together"""
+    # One-hot encode 'LANDCOVER' for all rows and place it after the numeric features
+    landcover_encoded = ohe.transform(df[['LANDCOVER']])
+    features = np.hstack([
+        df[NUMERIC_FEATURES].to_numpy(dtype=np.float32),
+        np.asarray(landcover_encoded, dtype=np.float32)
+    ])
+    return score_features(model.get_booster(), features)
 
-# Preprocess the new data: One-hot encode 'LANDCOVER'
-landcover_new_data = new_data[['LANDCOVER']]
-landcover_encoded_new = ohe.transform(landcover_new_data)
+if __name__ == '__main__':
+    import pandas as pd
 
-# Create a DataFrame from the encoded features with appropriate column names
-feature_names = ohe.get_feature_names_out(['LANDCOVER'])
-landcover_encoded_new_df = pd.DataFrame(landcover_encoded_new, columns=feature_names, index=new_data.index)
+    model, ohe = load_models('Models')
 
-new_data_processed = new_data.drop('LANDCOVER', axis=1).reset_index(drop=True)
-new_data_processed = pd.concat([new_data_processed, landcover_encoded_new_df], axis=1)
+    new_data = pd.DataFrame({
+        'ELEVATION': [2997.0, 2000, 500],
+        'SLOPE': [42.94040, 25, 5],
+        'LANDCOVER': ['Forest', 'Grassland', 'Others'],
+        'T2M': [-5.73, 15, 25],
+        'RH2M': [35.90, 60, 40],
+        'WS2M': [1.45, 3, 1],
+        'ssm(m³/m³)': [0.151760	, 0.15, 0.05]
+    })
 
-predictions = model.predict(new_data_processed)
+    fire_probabilities = predict_batch(new_data, model, ohe)
+    predictions = (fire_probabilities > 0.5).astype(int)
 
-print("Predictions:", predictions)
\ No newline at end of file
+    print("Predictions:", predictions)
+    print("Fire probabilities:", fire_probabilities)
\ No newline at end of file
@@ -1,21 +1,153 @@
+# Patch blocking stdlib I/O for gevent before anything else imports it
+from gevent import monkey
+monkey.patch_all()
+
 import logging
-import traceback
-from flask import Flask, request, jsonify
+from logging.handlers import MemoryHandler, WatchedFileHandler
+from flask import Flask, Response, request
+import orjson
+import fastjsonschema
+from fastjsonschema import JsonSchemaValueException
 import db
 from datetime import datetime, timezone
 import ai
+from utils.serialization import loads, JSONDecodeError
 import os
+import re
 import sys
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from werkzeug.exceptions import BadRequest, InternalServerError, NotFound, MethodNotAllowed
 
 app = Flask(__name__)
 
+# Options shared by every orjson-encoded response body
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_NUMPY
+
+class ORJSONResponse(Response):
+    """JSON response whose body is a Python object serialized with orjson"""
+    default_mimetype = 'application/json'
+
+    def __init__(self, obj=None, *args, **kwargs):
+        body = orjson.dumps(obj, option=ORJSON_OPTIONS, default=str)
+        super().__init__(body, *args, **kwargs)
+
+# Seconds /save_data waits for the batched database write before failing
+SAVE_TIMEOUT = 30
+
+# Request body validators, compiled once at import
+REQUIRED_SENSOR_FIELDS = ('humidity', 'temperature', 'soil_moisture')
+_NUMERIC_PATTERN = r"^\s*[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?\s*$"
+_NUMERIC_RE = re.compile(_NUMERIC_PATTERN)
+_NUMERIC = {"anyOf": [
+    {"type": "number"},
+    {"type": "string", "pattern": _NUMERIC_PATTERN}
+]}
+# Non-empty string or positive integer; 0 is rejected like any falsy id
+_ID = {"anyOf": [
+    {"type": "string", "minLength": 1},
+    {"type": "integer", "minimum": 1}
+]}
+
+_SAVE_DATA_VALIDATOR = fastjsonschema.compile({
+    "type": "object",
+    "required": ["device_id", "data"],
+    "properties": {
+        "device_id": _ID,
+        "data": {
+            "type": "object",
+            "required": list(REQUIRED_SENSOR_FIELDS),
+            "properties": {field: _NUMERIC for field in REQUIRED_SENSOR_FIELDS}
+        }
+    }
+})
+
+_CHAT_VALIDATOR = fastjsonschema.compile({
+    "type": "object",
+    "required": ["_id", "message"],
+    "properties": {
+        "_id": _ID,
+        "message": {"type": "string", "maxLength": 2000, "pattern": r"\S"}
+    }
+})
+
+_MISSING = object()
+
+def sensor_field_errors(sensor_data):
+    """Return every missing and every non-numeric required sensor field"""
+    missing_fields = []
+    invalid_fields = []
+    for field in REQUIRED_SENSOR_FIELDS:
+        value = sensor_data.get(field, _MISSING)
+        if value is _MISSING:
+            missing_fields.append(field)
+        elif isinstance(value, str):
+            if not _NUMERIC_RE.match(value):
+                invalid_fields.append(field)
+        elif not isinstance(value, (int, float)) or isinstance(value, bool):
+            invalid_fields.append(field)
+    return missing_fields, invalid_fields
+
+def _valid_id(value):
+    """Match _ID: a non-empty string or a positive integer"""
+    if isinstance(value, str):
+        return bool(value)
+    return isinstance(value, int) and not isinstance(value, bool) and value >= 1
+
+# The validators only report the first failing rule with its schema path, so
+# a rejected body is re-checked field by field in the original order to pick
+# the (error, message) returned to the client
+def save_data_error(request_data):
+    """Return the (error, message) pair for a /save_data body that failed validation"""
+    device_id = request_data.get('device_id') if isinstance(request_data, dict) else None
+    if not _valid_id(device_id):
+        return 'Missing device_id', 'device_id is required'
+    sensor_data = request_data.get('data')
+    if not sensor_data or not isinstance(sensor_data, dict):
+        return 'Invalid data', 'data field must be a non-empty object'
+    missing_fields, invalid_fields = sensor_field_errors(sensor_data)
+    if missing_fields:
+        return 'Missing required fields', f'Missing fields: {", ".join(missing_fields)}'
+    if invalid_fields:
+        return 'Invalid field values', f'Fields must be numeric: {", ".join(invalid_fields)}'
+    return 'Invalid request', 'Request body is invalid'
+
+def chat_error(data):
+    """Return the (error, message) pair for a /chat body that failed validation"""
+    message = data.get('message') if isinstance(data, dict) else None
+    if not message:
+        return 'Missing message', 'message field is required'
+    _id = data.get('_id')
+    if not _valid_id(_id):
+        return 'Missing _id', '_id field is required'
+    if not isinstance(message, str):
+        return 'Invalid message', 'message must be a string'
+    if not message.strip():
+        return 'Empty message', 'Message cannot be empty'
+    if len(message) > 2000:
+        return 'Message too long', 'Message must be less than 2000 characters'
+    return 'Invalid request', 'Request body is invalid'
+
+# Last /health probe result, reused for HEALTH_CACHE_TTL seconds so frequent
+# liveness probes don't each hit the database
+HEALTH_CACHE_TTL = 5
+_HEALTH_CACHE = {"ts": 0.0, "db": "unknown", "ml": "unknown"}
+
 # Enhanced logging configuration
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# File records are buffered in memory and written in batches; anything at
+# ERROR or above flushes the buffer immediately. Every gunicorn worker appends
+# to app.log, so rotate it externally (e.g. logrotate); the handler reopens
+# the file once it has been moved.
+file_handler = WatchedFileHandler('app.log')
+file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    format=LOG_FORMAT,
     handlers=[
-        logging.FileHandler('app.log'),
+        MemoryHandler(capacity=512, target=file_handler),
         logging.StreamHandler(sys.stdout)
     ]
 )
@@ -26,7 +158,7 @@ logger = logging.getLogger(__name__)
 @app.errorhandler(400)
 def bad_request(error):
     logger.warning(f"Bad request: {error}")
-    return jsonify({
+    return ORJSONResponse({
         'status': 'failed',
         'error': 'Bad request',
         'message': 'Invalid request format or missing required fields'
@@ -35,7 +167,7 @@ def bad_request(error):
 @app.errorhandler(404)
 def not_found(error):
     logger.warning(f"Route not found: {request.url}")
-    return jsonify({
+    return ORJSONResponse({
         'status': 'failed',
         'error': 'Route not found',
         'message': f'The requested URL {request.url} was not found on this server'
@@ -44,7 +176,7 @@ def not_found(error):
 @app.errorhandler(405)
 def method_not_allowed(error):
     logger.warning(f"Method not allowed: {request.method} {request.url}")
-    return jsonify({
+    return ORJSONResponse({
         'status': 'failed',
         'error': 'Method not allowed',
         'message': f'Method {request.method} is not allowed for this endpoint'
@@ -53,29 +185,36 @@ def method_not_allowed(error):
 @app.errorhandler(500)
 def internal_error(error):
     logger.error(f"Internal server error: {error}")
-    return jsonify({
+    return ORJSONResponse({
         'status': 'failed',
         'error': 'Internal server error',
         'message': 'An unexpected error occurred'
     }), 500
 
 # Handle SSL/TLS connection attempts to HTTP server
+# POST endpoints whose bodies are checked for stray TLS handshakes
+SSL_SNIFF_PATHS = frozenset(("/save_data", "/chat"))
+SSL_SNIFF_MAX_BYTES = 1024
+_TLS_MAGIC = b'\x16\x03'  # TLS record type "handshake", major version 3
+
 @app.before_request
 def handle_ssl_requests():
     """Handle SSL/TLS connection attempts to HTTP server"""
     try:
-        # Check if this looks like an SSL/TLS handshake
-        if request.environ.get('REQUEST_METHOD') == 'POST' and not request.content_type:
+        # Check if this looks like an SSL/TLS handshake; only small bodies on
+        # the POST endpoints are sniffed so large uploads are never buffered here
+        if (request.method == 'POST' and not request.content_type
+                and request.path in SSL_SNIFF_PATHS
+                and (request.content_length is None or request.content_length < SSL_SNIFF_MAX_BYTES)):
             raw_data = request.get_data()
-            if raw_data and len(raw_data) > 0:
-                # Check for TLS handshake signature (starts with \x16\x03)
-                if raw_data[:2] == b'\x16\x03':
-                    logger.warning("SSL/TLS connection attempt detected on HTTP endpoint")
-                    return jsonify({
-                        'status': 'failed',
-                        'error': 'SSL/TLS not supported',
-                        'message': 'This server only accepts HTTP requests. Use http:// instead of https://'
-                    }), 400
+            # Check for TLS handshake signature (starts with \x16\x03)
+            if raw_data.startswith(_TLS_MAGIC):
+                logger.warning("SSL/TLS connection attempt detected on HTTP endpoint")
+                return ORJSONResponse({
+                    'status': 'failed',
+                    'error': 'SSL/TLS not supported',
+                    'message': 'This server only accepts HTTP requests. Use http:// instead of https://'
+                }), 400
     except Exception as e:
         logger.warning(f"Error checking for SSL attempt: {e}")
         pass
@@ -84,8 +223,7 @@ def handle_ssl_requests():
 @app.route("/")
 def hello_world():
     try:
-        logger.info("Root endpoint accessed")
-        return jsonify({
+        return ORJSONResponse({
             "status": "success",
             "message": "Agro-tech Backend is running!",
             "endpoints": [
@@ -98,35 +236,36 @@ def hello_world():
         })
     except Exception as e:
         logger.error(f"Error in root endpoint: {e}")
-        return jsonify({'status': 'failed', 'error': str(e)}), 500
+        return ORJSONResponse({'status': 'failed', 'error': str(e)}), 500
 
 # Health check route
 @app.route("/health")
 def health_check():
     try:
-        logger.info("Health check accessed")
-        
-        # Test database connection
-        db_status = "connected"
-        try:
-            db.get_current_data()
-        except Exception as db_error:
-            db_status = f"error: {str(db_error)}"
-            logger.error(f"Database health check failed: {db_error}")
-        
-        # Test ML models
-        ml_status = "loaded" if ai.xgb_model is not None and ai.ohe_encoder is not None else "not loaded"
+        if time.monotonic() - _HEALTH_CACHE["ts"] >= HEALTH_CACHE_TTL:
+            # Test database connection
+            db_status = "connected"
+            try:
+                db.client.admin.command('ping')
+            except Exception as db_error:
+                db_status = f"error: {str(db_error)}"
+                logger.error(f"Database health check failed: {db_error}")
+            
+            # Test ML models
+            ml_status = "loaded" if ai.models_loaded() else "not loaded"
+            
+            _HEALTH_CACHE.update(ts=time.monotonic(), db=db_status, ml=ml_status)
         
-        return jsonify({
+        return ORJSONResponse({
             "status": "healthy", 
             "message": "API is running",
-            "database": db_status,
-            "ml_models": ml_status,
+            "database": _HEALTH_CACHE["db"],
+            "ml_models": _HEALTH_CACHE["ml"],
             "timestamp": datetime.now(timezone.utc).isoformat()
         })
     except Exception as e:
         logger.error(f"Error in health check: {e}")
-        return jsonify({'status': 'failed', 'error': str(e)}), 500
+        return ORJSONResponse({'status': 'failed', 'error': str(e)}), 500
 
 ## Route to get all sensor data
 @app.route("/get_all_data")
@@ -144,21 +283,26 @@ def get_all_data():
     ]
     """
     try:
-        logger.info("get_all_data endpoint accessed")
-        
-        result = db.get_all_data()
+        cursor = db.get_all_data()
+        # Pull the first document here so query errors still return a 500
+        first = next(cursor, None)
         
-        if result is None:
+        if first is None:
             logger.warning("No data found in database")
-            return jsonify([])
+            return ORJSONResponse([])
+        
+        def generate():
+            # Encode one document at a time; ObjectId falls back to str
+            yield b'[' + orjson.dumps(first, option=ORJSON_OPTIONS, default=str)
+            for doc in cursor:
+                yield b',' + orjson.dumps(doc, option=ORJSON_OPTIONS, default=str)
+            yield b']'
         
-        logger.info(f"Retrieved {len(result) if isinstance(result, list) else 1} records")
-        return jsonify(result)
+        return Response(generate(), mimetype='application/json')
         
     except Exception as e:
-        logger.error(f'Error in get_all_data: {e}')
-        logger.error(f'Stack trace: {traceback.format_exc()}')
-        return jsonify({
+        logger.exception(f'Error in get_all_data: {e}')
+        return ORJSONResponse({
             'status': 'failed',
             'error': 'Failed to retrieve data',
             'message': str(e)
@@ -180,26 +324,53 @@ def get_current_data():
     ]
     """
     try:
-        logger.info("get_current_data endpoint accessed")
-        
         result = db.get_current_data()
         
         if result is None:
             logger.warning("No current data found in database")
-            return jsonify([])
+            return ORJSONResponse([])
         
         logger.info("Retrieved current data successfully")
-        return jsonify(result)
+        return ORJSONResponse(result)
         
     except Exception as e:
-        logger.error(f'Error in get_current_data: {e}')
-        logger.error(f'Stack trace: {traceback.format_exc()}')
-        return jsonify({
+        logger.exception(f'Error in get_current_data: {e}')
+        return ORJSONResponse({
             'status': 'failed',
             'error': 'Failed to retrieve current data',
             'message': str(e)
         }), 500
 
+def predict_and_save(device_id, sensor_data):
+    """Predict flammability for a reading and store it, returning the save result"""
+    # Get AI prediction safely
+    try:
+        prediction = ai.predict_flammability(sensor_data)
+        logger.info(f"AI prediction completed: {prediction}")
+    except Exception as ai_error:
+        logger.exception(f"AI prediction error: {ai_error}")
+        prediction = 0  # Default to no fire risk
+        logger.warning("Using default prediction due to AI error")
+    
+    # Create the document to save
+    document = {
+        'device_id': str(device_id),
+        'timestamp': datetime.now(timezone.utc),  # stored as a BSON date
+        'data': sensor_data,
+        'prediction': int(prediction)
+    }
+    
+    # Batched with other concurrent requests into one insert_many
+    return db.writer.submit(document).result(timeout=SAVE_TIMEOUT)
+
+def save_chat_messages(_id, messages):
+    """Append a chat turn to the stored conversation in one write"""
+    try:
+        if not db.append_chat_messages(_id, messages):
+            logger.warning("Failed to save chat messages to database")
+    except Exception as db_error:
+        logger.error(f"Database error saving chat messages: {db_error}")
+
 ## Route to store sensor data
 @app.route("/save_data", methods=["POST"])
 def save_data():
@@ -217,17 +388,18 @@ def save_data():
             "light_intensity": float
         }
     }
+    device_id must be a non-empty string or a positive integer; humidity,
+    temperature and soil_moisture are required and must be numbers or numeric
+    strings.
     Response: {
         "status": "string"
     }
     """
     try:
-        logger.info("save_data endpoint accessed")
-        
         # Validate content type
         if not request.is_json:
             logger.warning(f"Invalid content type: {request.content_type}")
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Invalid content type',
                 'message': 'Request must be JSON'
@@ -235,10 +407,10 @@ def save_data():
         
         # Get JSON data safely
         try:
-            request_data = request.get_json()
-        except Exception as json_error:
+            request_data = loads(request.get_data(cache=False))
+        except JSONDecodeError as json_error:
             logger.error(f"JSON parsing error: {json_error}")
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Invalid JSON',
                 'message': 'Could not parse JSON data'
@@ -246,106 +418,58 @@ def save_data():
         
         if not request_data:
             logger.warning("Empty request body")
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Empty request',
                 'message': 'Request body cannot be empty'
             }), 400
         
-        # Extract and validate device_id
-        device_id = request_data.get('device_id')
-        if not device_id:
-            logger.warning("Missing device_id in request")
-            return jsonify({
-                'status': 'failed',
-                'error': 'Missing device_id',
-                'message': 'device_id is required'
-            }), 400
-        
-        # Extract and validate sensor data
-        sensor_data = request_data.get('data', {})
-        if not sensor_data or not isinstance(sensor_data, dict):
-            logger.warning("Missing or invalid sensor data")
-            return jsonify({
-                'status': 'failed',
-                'error': 'Invalid data',
-                'message': 'data field must be a non-empty object'
-            }), 400
-        
-        # Validate required sensor fields
-        required_fields = ['humidity', 'temperature', 'soil_moisture']
-        missing_fields = []
-        invalid_fields = []
-        
-        for field in required_fields:
-            if field not in sensor_data:
-                missing_fields.append(field)
-            else:
-                try:
-                    float(sensor_data[field])
-                except (ValueError, TypeError):
-                    invalid_fields.append(field)
-        
-        if missing_fields:
-            logger.warning(f"Missing required fields: {missing_fields}")
-            return jsonify({
-                'status': 'failed',
-                'error': 'Missing required fields',
-                'message': f'Missing fields: {", ".join(missing_fields)}'
-            }), 400
-        
-        if invalid_fields:
-            logger.warning(f"Invalid field values: {invalid_fields}")
-            return jsonify({
+        # Validate device_id and the required sensor fields
+        try:
+            _SAVE_DATA_VALIDATOR(request_data)
+        except JsonSchemaValueException as e:
+            error, detail = save_data_error(request_data)
+            logger.warning(f"Invalid save_data request: {e.message}")
+            return ORJSONResponse({
                 'status': 'failed',
-                'error': 'Invalid field values',
-                'message': f'Fields must be numeric: {", ".join(invalid_fields)}'
+                'error': error,
+                'message': detail
             }), 400
         
-        # Get AI prediction safely
-        try:
-            prediction = ai.predict_flammability(sensor_data)
-            logger.info(f"AI prediction completed: {prediction}")
-        except Exception as ai_error:
-            logger.error(f"AI prediction error: {ai_error}")
-            logger.error(f'AI Stack trace: {traceback.format_exc()}')
-            prediction = 0  # Default to no fire risk
-            logger.warning("Using default prediction due to AI error")
+        device_id = request_data['device_id']
+        sensor_data = request_data['data']
         
-        # Create the document to save
-        document = {
-            'device_id': str(device_id),
-            'timestamp': datetime.now(timezone.utc).isoformat(),
-            'data': sensor_data,
-            'prediction': int(prediction)
-        }
-        
-        # Save to database
+        # Predict and save
         try:
-            save_result = db.save_data(document)
+            save_result = predict_and_save(device_id, sensor_data)
             if save_result:
                 logger.info(f"Data saved successfully for device: {device_id}")
-                return jsonify({'status': 'success'})
+                return ORJSONResponse({'status': 'success'})
             else:
                 logger.error("Database save operation returned False")
-                return jsonify({
+                return ORJSONResponse({
                     'status': 'failed',
                     'error': 'Database save failed',
                     'message': 'Could not save data to database'
                 }), 500
+        except FutureTimeoutError:
+            logger.error(f"Database write timed out after {SAVE_TIMEOUT}s for device: {device_id}")
+            return ORJSONResponse({
+                'status': 'failed',
+                'error': 'Database save failed',
+                'message': 'Could not save data to database'
+            }), 500
         except Exception as db_error:
-            logger.error(f"Database error: {db_error}")
-            logger.error(f'DB Stack trace: {traceback.format_exc()}')
-            return jsonify({
+            logger.exception(f"Database error: {db_error}")
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Database error',
                 'message': str(db_error)
             }), 500
             
     except Exception as e:
-        logger.error(f'Unexpected error in save_data: {e}')
-        logger.error(f'Stack trace: {traceback.format_exc()}')
-        return jsonify({
+        logger.exception(f'Unexpected error in save_data: {e}')
+        return ORJSONResponse({
             'status': 'failed',
             'error': 'Internal server error',
             'message': 'An unexpected error occurred'
@@ -355,19 +479,20 @@ def save_data():
 @app.route("/chat", methods=["POST"])
 def chat():
     """
-    This is chat route which takes a json in body and response markdown text in text/plain content-type.
+    This is chat route which takes a json in body and streams markdown text in text/plain content-type.
     Expected Json body: {
         "_id": "(IMEI number maybe)",
         "message": "Chat message"
     }
+    _id must be a non-empty string or a positive integer. message must be a
+    string with a non-whitespace character and at most 2000 characters; other
+    JSON types are rejected rather than converted with str().
     """
     try:
-        logger.info("chat endpoint accessed")
-        
         # Validate content type
         if not request.is_json:
             logger.warning(f"Invalid content type for chat: {request.content_type}")
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Invalid content type',
                 'message': 'Request must be JSON'
@@ -375,111 +500,86 @@ def chat():
         
         # Get JSON data safely
         try:
-            data = request.get_json()
-        except Exception as json_error:
+            data = loads(request.get_data(cache=False))
+        except JSONDecodeError as json_error:
             logger.error(f"JSON parsing error in chat: {json_error}")
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Invalid JSON',
                 'message': 'Could not parse JSON data'
             }), 400
         
         if not data:
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'Empty request',
                 'message': 'Request body cannot be empty'
             }), 400
         
-        # Extract and validate required fields
-        message = data.get("message")
-        _id = data.get("_id")
-        
-        if not message:
-            logger.warning("Missing message in chat request")
-            return jsonify({
-                'status': 'failed',
-                'error': 'Missing message',
-                'message': 'message field is required'
-            }), 400
-        
-        if not _id:
-            logger.warning("Missing _id in chat request")
-            return jsonify({
-                'status': 'failed',
-                'error': 'Missing _id',
-                'message': '_id field is required'
-            }), 400
-        
-        # Validate message length
-        if len(str(message).strip()) == 0:
-            return jsonify({
+        # Validate _id and message
+        try:
+            _CHAT_VALIDATOR(data)
+        except JsonSchemaValueException as e:
+            error, detail = chat_error(data)
+            logger.warning(f"Invalid chat request: {e.message}")
+            return ORJSONResponse({
                 'status': 'failed',
-                'error': 'Empty message',
-                'message': 'Message cannot be empty'
+                'error': error,
+                'message': detail
             }), 400
         
-        if len(str(message)) > 2000:  # Reasonable limit
-            return jsonify({
-                'status': 'failed',
-                'error': 'Message too long',
-                'message': 'Message must be less than 2000 characters'
-            }), 400
+        message = data['message']
+        _id = data['_id']
         
         logger.info(f"Processing chat for user: {_id}")
         
-        # Add user message to conversation
-        try:
-            user_msg_result = db.update_chat(_id, {'role': 'user', 'content': str(message)})
-            if not user_msg_result:
-                logger.error("Failed to save user message to database")
-                return jsonify({
-                    'status': 'failed',
-                    'error': 'Database error',
-                    'message': 'Could not save user message'
-                }), 500
-        except Exception as db_error:
-            logger.error(f"Database error saving user message: {db_error}")
-            return jsonify({
-                'status': 'failed',
-                'error': 'Database error',
-                'message': str(db_error)
-            }), 500
+        user_msg = {'role': 'user', 'content': str(message)}
         
         # Get AI response
         try:
-            response = ai.get_explanation(_id)
-            logger.info(f"AI response generated for user: {_id}")
+            response = ai.get_explanation(_id, user_msg)
         except Exception as ai_error:
-            logger.error(f"AI response error: {ai_error}")
-            logger.error(f'AI Stack trace: {traceback.format_exc()}')
-            response = "Sorry, I'm currently experiencing technical difficulties. Please try again later."
+            logger.exception(f"AI response error: {ai_error}")
+            response = iter(["Sorry, I'm currently experiencing technical difficulties. Please try again later."])
         
         # Check if AI response was successful
-        if not response or response.startswith("Error:"):
+        if isinstance(response, str):
             logger.error(f'AI response failed: {response}')
-            return jsonify({
+            return ORJSONResponse({
                 'status': 'failed',
                 'error': 'AI service error',
                 'message': response or 'AI service unavailable'
             }), 500
         
-        # Add AI response to conversation
-        try:
-            ai_msg_result = db.update_chat(_id, {'role': 'assistant', 'content': str(response)})
-            if not ai_msg_result:
-                logger.warning("Failed to save AI response to database")
-                # Don't fail the request, just log the warning
-        except Exception as db_error:
-            logger.error(f"Database error saving AI response: {db_error}")
-            # Don't fail the request, just log the error
+        def generate():
+            # Stream the response to the client as it arrives
+            parts = []
+            try:
+                for text in response:
+                    parts.append(text)
+                    yield text.encode('utf-8')
+            except GeneratorExit:
+                logger.warning(f"Client disconnected from chat for user {_id} after {sum(map(len, parts))} characters")
+                raise
+            except Exception as stream_error:
+                logger.error(f"AI response stream failed for user {_id}: {stream_error}")
+                return
+            finally:
+                # Release the upstream connection even when the client leaves early
+                if hasattr(response, 'close'):
+                    response.close()
+            logger.info(f"AI response generated for user: {_id}")
+            
+            # Save the turn before the response ends so the next request on this
+            # conversation reads it back from the database
+            save_chat_messages(_id, [user_msg, {'role': 'assistant', 'content': ''.join(parts)}])
         
-        return response, 200, {'Content-Type': 'text/plain'}
+        # Chunks are already utf-8 bytes, so werkzeug can pass them straight through
+        return Response(generate(), content_type='text/plain; charset=utf-8', direct_passthrough=True)
         
     except Exception as e:
-        logger.error(f'Unexpected error in chat: {e}')
-        logger.error(f'Stack trace: {traceback.format_exc()}')
-        return jsonify({
+        logger.exception(f'Unexpected error in chat: {e}')
+        return ORJSONResponse({
             'status': 'failed',
             'error': 'Internal server error',
             'message': 'An unexpected error occurred'
@@ -490,6 +590,7 @@ if __name__ == '__main__':
         port = int(os.environ.get('PORT', 5000))
         logger.info(f"Starting server on port {port}")
         logger.info("Server is HTTP only - use http:// not https://")
+        logger.info("This is the development server; in production run: gunicorn -c gunicorn.conf.py app:app")
         app.run(host='0.0.0.0', port=port, debug=False)
     except Exception as e:
         logger.error(f"Failed to start server: {e}")
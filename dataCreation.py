@@ -1,10 +1,17 @@
 # Weather enrichment script for clean fire data - SAFE VERSION
 
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from datetime import datetime
 import time
 import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
 
 # === SAFER CONFIG ===
 NASA_POWER_URL = "https://power.larc.nasa.gov/api/temporal/daily/point"
@@ -13,93 +20,137 @@ COMMUNITY = "RE"
 FORMAT = "JSON"
 INPUT_FILE = "subset.xlsx"
 OUTPUT_FILE = "enriched_fire_data_1000_rows.xlsx"  # Updated filename
-CHECKPOINT_FILE = "processing_checkpoint.xlsx"
+CHECKPOINT_FILE = "processing_checkpoint.parquet"
+WEATHER_CACHE_FILE = "weather_cache.pkl"  # NASA responses reused across runs
 MAX_ROWS = 1000  # Process all 1000 rows at once
 FIRE_LABEL = 1
 CHECKPOINT_INTERVAL = 25  # Save progress every 25 rows
-DELAY_BETWEEN_REQUESTS = 2  # 2 seconds (safe)
+MAX_WORKERS = 8  # Parallel requests in flight
+REQUESTS_PER_SECOND = 4  # Shared cap across all workers (safe)
 MAX_RETRIES = 3  # Retry failed requests
+WEATHER_COLUMNS = ["T2M", "RH2M", "WS2M", "PRECTOTCORR"]
+
+# === RATE LIMITER SHARED BY ALL WORKER THREADS ===
+class RateLimiter:
+    """Space out calls from all threads to at most `rate` per second"""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+rate_limiter = RateLimiter(REQUESTS_PER_SECOND)
+
+# === PERSISTENT HTTP SESSION ===
+# Keep-alive connections are reused across all rows and worker threads;
+# urllib3 retries failed requests with exponential backoff
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=MAX_RETRIES, backoff_factor=2, status_forcelist=[429, 500, 502, 503, 504])
+))
+
+# === WEATHER RESPONSE CACHE ===
+# NASA POWER is on a 0.5° grid, so nearby fires on the same day share a
+# response; key on lat/lon rounded to 1 decimal place
+_WEATHER_CACHE: dict[tuple, dict] = {}
+_WEATHER_CACHE_LOCK = threading.Lock()
+
+def load_weather_cache():
+    """Load cached NASA responses from a previous run if present"""
+    if os.path.exists(WEATHER_CACHE_FILE):
+        try:
+            with open(WEATHER_CACHE_FILE, "rb") as f:
+                cached = pickle.load(f)
+            with _WEATHER_CACHE_LOCK:
+                _WEATHER_CACHE.update(cached)
+            print(f"📦 Loaded {len(cached)} cached weather responses")
+        except Exception as e:
+            print(f"⚠️  Could not load weather cache: {e}")
+
+def save_weather_cache():
+    """Persist cached NASA responses for the next run"""
+    with _WEATHER_CACHE_LOCK:
+        snapshot = dict(_WEATHER_CACHE)
+    with open(WEATHER_CACHE_FILE, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
 
 # === FUNCTION TO SAVE PROGRESS ===
 def save_checkpoint(df, processed_count):
     """Save current progress to checkpoint file"""
-    df.to_excel(CHECKPOINT_FILE, index=False)
-    print(f"💾 Checkpoint saved! Progress: {processed_count} rows completed")
+    df.to_parquet(CHECKPOINT_FILE, engine='pyarrow', compression='snappy')
+    save_weather_cache()
+    tqdm.write(f"💾 Checkpoint saved! Progress: {processed_count} rows completed")
 
 # === FUNCTION TO LOAD PREVIOUS PROGRESS ===
 def load_checkpoint():
     """Load previous progress if exists"""
     if os.path.exists(CHECKPOINT_FILE):
         print(f"📁 Found checkpoint file. Loading previous progress...")
-        return pd.read_excel(CHECKPOINT_FILE)
+        return pd.read_parquet(CHECKPOINT_FILE)
     return None
 
-# === FUNCTION TO FORMAT DATE ===
-def format_date(date_obj):
-    """Convert datetime object to YYYYMMDD format for NASA API"""
+# === IMPROVED WEATHER DATA FUNCTION WITH RETRY ===
+def get_weather_data_with_retry(lat, lon, date):
+    """Fetch weather data; retries with exponential backoff are handled by the session"""
+    key = (round(lat, 1), round(lon, 1), date)
+    cached = _WEATHER_CACHE.get(key)
+    if cached is not None:
+        return cached
+    
     try:
-        if isinstance(date_obj, str):
-            dt = datetime.strptime(date_obj, "%Y-%m-%d %H:%M:%S")
-        else:
-            dt = date_obj
+        params = {
+            "parameters": PARAMETERS,
+            "start": date,
+            "end": date,
+            "latitude": lat,
+            "longitude": lon,
+            "format": FORMAT,
+            "community": COMMUNITY
+        }
         
-        return dt.strftime("%Y%m%d")
-    except Exception as e:
-        print(f"Error parsing date {date_obj}: {e}")
-        return None
-
-# === IMPROVED WEATHER DATA FUNCTION WITH RETRY ===
-def get_weather_data_with_retry(lat, lon, date, max_retries=MAX_RETRIES):
-    """Fetch weather data with retry logic and exponential backoff"""
-    for attempt in range(max_retries):
-        try:
-            params = {
-                "parameters": PARAMETERS,
-                "start": date,
-                "end": date,
-                "latitude": lat,
-                "longitude": lon,
-                "format": FORMAT,
-                "community": COMMUNITY
-            }
-            
-            print(f"   🌤️  Fetching weather (attempt {attempt + 1}/{max_retries})")
-            response = requests.get(NASA_POWER_URL, params=params, timeout=30)
-            response.raise_for_status()
-            
-            data = response.json()
-            props = data["properties"]["parameter"]
-            
-            weather_data = {
-                "T2M": props["T2M"].get(date, None),
-                "RH2M": props["RH2M"].get(date, None),
-                "WS2M": props["WS2M"].get(date, None),
-                "PRECTOTCORR": props["PRECTOTCORR"].get(date, None)
-            }
-            
-            print(f"   ✅ Success! T2M={weather_data['T2M']}°C, RH2M={weather_data['RH2M']}%, WS2M={weather_data['WS2M']}m/s, PREC={weather_data['PRECTOTCORR']}mm")
-            return weather_data
-            
-        except requests.exceptions.RequestException as e:
-            print(f"   ❌ Attempt {attempt + 1} failed: HTTP Error - {e}")
-        except KeyError as e:
-            print(f"   ❌ Attempt {attempt + 1} failed: Data parsing error - {e}")
-        except Exception as e:
-            print(f"   ❌ Attempt {attempt + 1} failed: {e}")
+        rate_limiter.wait()
+        response = _SESSION.get(NASA_POWER_URL, params=params, timeout=30)
+        response.raise_for_status()
         
-        # If not the last attempt, wait with exponential backoff
-        if attempt < max_retries - 1:
-            wait_time = (attempt + 1) * 2  # 2s, 4s, 6s...
-            print(f"   ⏳ Waiting {wait_time} seconds before retry...")
-            time.sleep(wait_time)
+        data = response.json()
+        props = data["properties"]["parameter"]
+        
+        weather_data = {
+            "T2M": props["T2M"].get(date, None),
+            "RH2M": props["RH2M"].get(date, None),
+            "WS2M": props["WS2M"].get(date, None),
+            "PRECTOTCORR": props["PRECTOTCORR"].get(date, None)
+        }
+        
+        with _WEATHER_CACHE_LOCK:
+            _WEATHER_CACHE[key] = weather_data
+        
+        return weather_data
+        
+    except requests.exceptions.RequestException as e:
+        tqdm.write(f"   💥 Request failed after {MAX_RETRIES} retries: HTTP Error - {e} - using NULL values")
+    except KeyError as e:
+        tqdm.write(f"   💥 Data parsing error - {e} - using NULL values")
+    except Exception as e:
+        tqdm.write(f"   💥 Request failed: {e} - using NULL values")
     
-    print(f"   💥 All {max_retries} attempts failed - using NULL values")
     return {"T2M": None, "RH2M": None, "WS2M": None, "PRECTOTCORR": None}
 
 # === MAIN FUNCTION TO ENRICH FIRE DATA ===
 def enrich_fire_data():
     """Process clean fire data Excel and enrich with weather data - SAFE VERSION"""
     try:
+        load_weather_cache()
+        
         # Check if we can resume from checkpoint
         checkpoint_df = load_checkpoint()
         if checkpoint_df is not None:
@@ -109,7 +160,7 @@ def enrich_fire_data():
                 df_subset = checkpoint_df
                 # Find where to resume (look for rows without weather data)
                 mask = df_subset["T2M"].isna()
-                start_index = df_subset[mask].index[0] if mask.any() else len(df_subset)
+                start_index = int(mask.to_numpy().argmax()) if mask.any() else len(df_subset)
                 processed_count = start_index
             else:
                 print("🆕 Starting fresh...")
@@ -136,10 +187,8 @@ def enrich_fire_data():
             df_subset = df.head(MAX_ROWS).copy()
             
             # Initialize new columns for weather data
-            df_subset["T2M"] = None
-            df_subset["RH2M"] = None
-            df_subset["WS2M"] = None
-            df_subset["PRECTOTCORR"] = None
+            for col in WEATHER_COLUMNS:
+                df_subset[col] = np.nan
             
             # 🔥 ADD FIRE LABEL COLUMN
             df_subset["fire"] = FIRE_LABEL
@@ -150,72 +199,78 @@ def enrich_fire_data():
         
         print(f"🚀 Starting processing from row {start_index + 1}...")
         
-        for index, row in df_subset.iterrows():
-            # Skip rows that are already processed
-            if index < start_index:
-                continue
-                
+        # Collect results into one float array per column and assign them
+        # back as whole columns instead of per-cell .at writes
+        weather_arrays = {col: df_subset[col].to_numpy(dtype=float, na_value=np.nan, copy=True) for col in WEATHER_COLUMNS}
+        
+        def flush_weather_arrays():
+            for col, values in weather_arrays.items():
+                df_subset[col] = values
+        
+        # Build the list of rows to fetch up front from whole columns
+        try:
+            lats = df_subset["LATITUDE"].to_numpy()
+            lons = df_subset["LONGITUDE"].to_numpy()
+            # Convert all dates to YYYYMMDD for the NASA API at once; bad dates become NaN
+            api_dates = pd.to_datetime(df_subset["ACQ_DATE"], format="%Y-%m-%d %H:%M:%S", errors="coerce").dt.strftime("%Y%m%d").to_numpy(dtype=object)
+        except KeyError as e:
+            print(f"❌ Missing required column - {e}")
+            return
+        
+        tasks = []
+        # Rows before start_index are already processed
+        for index in range(start_index, len(df_subset)):
             try:
-                # Extract data from your clean format
-                lat = float(row["LATITUDE"])
-                lon = float(row["LONGITUDE"])
-                acq_date = row["ACQ_DATE"]
-                
-                print(f"\n🔥 Row {index + 1}/{MAX_ROWS}: Processing fire incident")
-                print(f"   📍 Location: {lat:.5f}, {lon:.5f}")
-                print(f"   📅 Date: {acq_date}")
-                print(f"   🏛️  District: {row.get('DISTRICT', 'N/A')}")
-                print(f"   🏷️  Fire Label: {FIRE_LABEL}")
+                lat = float(lats[index])
+                lon = float(lons[index])
                 
-                # Format date for NASA API
-                formatted_date = format_date(acq_date)
-                if not formatted_date:
-                    print(f"   ⚠️  Skipping row due to invalid date format")
+                formatted_date = api_dates[index]
+                if pd.isna(formatted_date):
+                    print(f"   ⚠️  Row {index + 1}: Skipping row due to invalid date format")
                     failed_count += 1
                     continue
                 
-                # Get weather data with retry logic
-                weather = get_weather_data_with_retry(lat, lon, formatted_date)
-                
-                # Update DataFrame with weather data
-                df_subset.at[index, "T2M"] = weather["T2M"]
-                df_subset.at[index, "RH2M"] = weather["RH2M"]
-                df_subset.at[index, "WS2M"] = weather["WS2M"]
-                df_subset.at[index, "PRECTOTCORR"] = weather["PRECTOTCORR"]
-                
-                processed_count += 1
-                
-                # Calculate ETA
-                elapsed = datetime.now() - start_time
-                if processed_count > 0:
-                    avg_time_per_row = elapsed.total_seconds() / (processed_count - start_index)
-                    remaining_rows = MAX_ROWS - processed_count
-                    eta_seconds = remaining_rows * avg_time_per_row
-                    eta_minutes = eta_seconds / 60
-                    print(f"   ⏱️  ETA: ~{eta_minutes:.1f} minutes remaining")
-                
-                print(f"   ✅ Row {index + 1} processed successfully ({processed_count}/{MAX_ROWS})")
-                
-                # Save checkpoint periodically
-                if processed_count % CHECKPOINT_INTERVAL == 0:
-                    save_checkpoint(df_subset, processed_count)
-                
-                # Increased delay for safety
-                print(f"   ⏳ Waiting {DELAY_BETWEEN_REQUESTS} seconds...")
-                time.sleep(DELAY_BETWEEN_REQUESTS)
+                tasks.append((index, lat, lon, formatted_date))
                 
             except ValueError as e:
                 print(f"   ⚠️  Row {index + 1}: Invalid latitude/longitude values - {e}")
                 failed_count += 1
-                continue
-            except KeyError as e:
-                print(f"   ⚠️  Row {index + 1}: Missing required column - {e}")
-                failed_count += 1
-                continue
-            except Exception as e:
-                print(f"   ❌ Row {index + 1}: Unexpected error - {e}")
-                failed_count += 1
-                continue
+        
+        # Fetch weather for all rows in parallel; the shared rate limiter
+        # keeps the total request rate polite
+        executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+        try:
+            futures = {
+                executor.submit(get_weather_data_with_retry, lat, lon, formatted_date): (index, lat, lon, formatted_date)
+                for index, lat, lon, formatted_date in tasks
+            }
+            
+            # One progress bar (with ETA) instead of several prints per row
+            for future in tqdm(as_completed(futures), total=len(futures), desc="NASA POWER", unit="row"):
+                index, lat, lon, formatted_date = futures[future]
+                try:
+                    weather = future.result()
+                    
+                    # Store weather data at the row's position
+                    for col, values in weather_arrays.items():
+                        value = weather[col]
+                        values[index] = np.nan if value is None else value
+                    
+                    processed_count += 1
+                    
+                    # Save checkpoint periodically
+                    if processed_count % CHECKPOINT_INTERVAL == 0:
+                        flush_weather_arrays()
+                        save_checkpoint(df_subset, processed_count)
+                    
+                except Exception as e:
+                    tqdm.write(f"   ❌ Row {index + 1}: Unexpected error - {e}")
+                    failed_count += 1
+        finally:
+            # On Ctrl+C, drop the rows that have not started yet
+            executor.shutdown(wait=True, cancel_futures=True)
+            flush_weather_arrays()
+            save_weather_cache()
         
         # Save final result
         df_subset.to_excel(OUTPUT_FILE, index=False)
@@ -254,6 +309,6 @@ if __name__ == "__main__":
     print("🔥 Fire Data Weather Enrichment Script - SAFE VERSION")
     print("🌤️  Adding NASA POWER Weather Data (T2M, RH2M, WS2M, PRECTOTCORR)")
     print("🏷️  Adding Fire Label Column for Model Training")
-    print("🛡️  Features: Retry logic, Checkpoints, ETA calculation")
+    print("🛡️  Features: Parallel rate-limited requests, Retry logic, Checkpoints, Progress bar with ETA")
     print("=" * 70)
     enrich_fire_data()
\ No newline at end of file
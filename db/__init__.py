@@ -1 +1,20 @@
-from .db import *
\ No newline at end of file
+from .db import (
+    BatchWriter,
+    CHAT_CACHE_TTL,
+    JSONEncoder,
+    SYSTEM_MESSAGE,
+    SYSTEM_PROMPT,
+    append_chat_messages,
+    chats_collection,
+    client,
+    data_collection,
+    ensure_indexes,
+    get_all_data,
+    get_chat,
+    get_current_data,
+    redis_client,
+    save_data,
+    save_data_bulk,
+    update_chat,
+    writer,
+)
\ No newline at end of file
@@ -1,11 +1,35 @@
 import os
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from bson import ObjectId
+from cachetools import TTLCache, cached
+from utils.serialization import dumps, loads
+from utils.batching import Batcher
 import json
 
 load_dotenv()
-client = MongoClient(os.getenv("MONGO_CONNECTION_STRING"))
+# connect=False defers connecting until first use, so each forked server
+# worker opens its own sockets. A few pooled connections are kept warm and
+# idle ones are closed after a minute; wire compression shrinks bulk reads
+client = MongoClient(
+    os.getenv("MONGO_CONNECTION_STRING"),
+    connect=False,
+    maxPoolSize=50,
+    minPoolSize=5,
+    maxIdleTimeMS=60000,
+    compressors="zstd,zlib",
+    retryReads=True,
+    w=1
+)
+
+# Optional Redis cache for chat conversations, shared by all workers
+REDIS_URL = os.getenv("REDIS_URL")
+CHAT_CACHE_TTL = 60  # seconds
+redis_client = None
+if REDIS_URL:
+    import redis
+    redis_client = redis.Redis.from_url(REDIS_URL)
 
 db = client.Unnchai
 data_collection = db.Data
@@ -19,84 +43,146 @@ class JSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, o)
 
 ## SENSOR DATA AND PREDICTION
+_indexes_ready = False
+
+def ensure_indexes():
+    # Created on first use rather than at import so no connection is opened
+    # before the server forks its workers
+    global _indexes_ready
+    if not _indexes_ready:
+        data_collection.create_index([("timestamp", -1)])
+        _indexes_ready = True
+
+
 def save_data(data):
     result = data_collection.insert_one(data)
+    _current_data_cache.clear()
     return result.acknowledged
 
 
+def save_data_bulk(docs):
+    # Unordered so one bad document doesn't stop the rest of the batch
+    result = data_collection.insert_many(docs, ordered=False)
+    _current_data_cache.clear()
+    return result.acknowledged
+
+
+WRITE_BATCH = 100
+WRITE_BATCH_TIMEOUT = 0.005
+
+class BatchWriter(Batcher):
+    """
+    Collects sensor documents from concurrent requests and writes them with a
+    single insert_many on a background thread.
+
+    submit() returns a Future resolving to whether the document was saved.
+    """
+
+    thread_name = "sensor-data-writer"
+
+    def __init__(self, max_batch=WRITE_BATCH, timeout=WRITE_BATCH_TIMEOUT):
+        super().__init__(max_batch, timeout)
+
+    def _process(self, batch, state):
+        documents = [document for document, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            acknowledged = save_data_bulk(documents)
+            for future in futures:
+                future.set_result(acknowledged)
+        except BulkWriteError as e:
+            # Only the documents listed in writeErrors failed
+            failed = {error['index'] for error in e.details.get('writeErrors', [])}
+            for i, future in enumerate(futures):
+                future.set_result(i not in failed)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+
+
+writer = BatchWriter()
+
+
+# Aggregation stage that converts ObjectId to string on the server
+_ID_TO_STRING = {"$addFields": {"_id": {"$toString": "$_id"}}}
+
+# Documents per cursor batch when reading the whole collection
+BULK_BATCH_SIZE = 1000
+
+
 def get_all_data():
-    result = data_collection.find({}).sort("_id", -1)
-    documents = list(result)
-    # Convert ObjectId to string for JSON serialization
-    for doc in documents:
-        if '_id' in doc:
-            doc['_id'] = str(doc['_id'])
-    return documents
+    # Return the cursor so callers can stream documents instead of loading them all
+    ensure_indexes()
+    return data_collection.aggregate([{"$sort": {"timestamp": -1}}, _ID_TO_STRING], batchSize=BULK_BATCH_SIZE)
+
 
+# Latest reading, reused for 2 seconds since clients poll this endpoint
+_current_data_cache = TTLCache(maxsize=1, ttl=2)
 
+@cached(_current_data_cache)
 def get_current_data():
-    print("=== DEBUGGING get_current_data ===")
-    
-    # Get all documents and show their _id and timestamp
-    all_docs = list(data_collection.find({}, {"_id": 1, "timestamp": 1, "device_id": 1}).sort("_id", -1).limit(5))
-    print("Top 5 documents sorted by _id (newest first):")
-    for i, doc in enumerate(all_docs):
-        print(f"  {i+1}. _id: {doc['_id']} | timestamp: {doc.get('timestamp')} | device: {doc.get('device_id')}")
-    
-    # Also try sorting by timestamp
-    all_docs_by_time = list(data_collection.find({}, {"_id": 1, "timestamp": 1, "device_id": 1}).sort("timestamp", -1).limit(5))
-    print("\nTop 5 documents sorted by timestamp (newest first):")
-    for i, doc in enumerate(all_docs_by_time):
-        print(f"  {i+1}. _id: {doc['_id']} | timestamp: {doc.get('timestamp')} | device: {doc.get('device_id')}")
-    
-    # Get what we're actually returning
-    latest_record = data_collection.find().sort("_id", -1).limit(1)
-    documents = list(latest_record)
-    
-    print(f"\n=== RETURNING ===")
-    if documents:
-        print(f"Returning document:")
-        print(f"  _id: {documents[0]['_id']}")
-        print(f"  timestamp: {documents[0].get('timestamp')}")
-        print(f"  device_id: {documents[0].get('device_id')}")
-    else:
-        print("No documents found!")
-    
-    # Convert ObjectId to string for JSON serialization
-    for doc in documents:
-        if '_id' in doc:
-            doc['_id'] = str(doc['_id'])
-    
-    return documents
+    ensure_indexes()
+    return list(data_collection.aggregate([{"$sort": {"timestamp": -1}}, {"$limit": 1}, _ID_TO_STRING]))
 
 
 
 ## CHATS
+SYSTEM_PROMPT = "You are a knowledgeable AI assistant specializing in agriculture, particularly in the context of Nepal. Your role is to provide concise and relevant answers to user queries related to farming practices, crop cultivation, agricultural policies, and challenges faced by farmers in Nepal. Ensure that your responses are tailored to the unique agricultural landscape of Nepal, considering local practices, climate, and economic factors. DONOT answer anything beside Agriculture"
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+
+def _chat_key(_id):
+    # JSON-encode the id so 5 and "5", which are separate Mongo documents,
+    # get separate cache entries
+    return b"chat:" + dumps(_id)
+
+
+def _forget_chat(_id):
+    if redis_client is not None:
+        try:
+            redis_client.delete(_chat_key(_id))
+        except redis.RedisError:
+            pass
+
+
 def get_chat(_id):
-    document = list(chats_collection.find({"_id": _id}))
+    if redis_client is not None:
+        try:
+            cached_document = redis_client.get(_chat_key(_id))
+            if cached_document:
+                return [loads(cached_document)]
+        except redis.RedisError:
+            pass
+
+    # Chat ids are client-supplied strings or integers, so no ObjectId conversion is needed
+    document = chats_collection.find_one({"_id": _id})
     if document:
-        # Convert ObjectId to string for JSON serialization
-        for doc in document:
-            if '_id' in doc:
-                doc['_id'] = str(doc['_id'])
-        return document
+        if redis_client is not None:
+            try:
+                redis_client.setex(_chat_key(_id), CHAT_CACHE_TTL, dumps(document))
+            except redis.RedisError:
+                pass
+        return [document]
     else:
         return False
 
 
 def update_chat(_id, new_chat):
+    # One upsert instead of find_one + insert_one + update_one; see append_chat_messages
+    return append_chat_messages(_id, [new_chat])
 
-    if not chats_collection.find_one({"_id" : _id}):
-        chats_collection.insert_one({"_id" : _id, "conversation": [
-                    {
-                        "role": "system",
-                        "content": "You are a knowledgeable AI assistant specializing in agriculture, particularly in the context of Nepal. Your role is to provide concise and relevant answers to user queries related to farming practices, crop cultivation, agricultural policies, and challenges faced by farmers in Nepal. Ensure that your responses are tailored to the unique agricultural landscape of Nepal, considering local practices, climate, and economic factors. DONOT answer anything beside Agriculture",
-                    }
-                ]})
 
+def append_chat_messages(_id, messages):
+    # Push all messages in one update; a new conversation starts with the system prompt.
+    # $literal keeps message text beginning with "$" from being read as an expression.
     result = chats_collection.update_one(
         {"_id": _id},
-        {"$push": {"conversation": new_chat}}
+        [{"$set": {"conversation": {"$concatArrays": [
+            {"$ifNull": ["$conversation", {"$literal": [SYSTEM_MESSAGE]}]},
+            {"$literal": messages}
+        ]}}}],
+        upsert=True
     )
+    _forget_chat(_id)
 
     return result.acknowledged
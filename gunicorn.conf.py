@@ -0,0 +1,20 @@
+# Gunicorn configuration, loaded automatically by `gunicorn app:app`
+# from the project directory
+
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# gevent workers: the hot endpoints spend nearly all their time waiting on
+# MongoDB and the Groq API, so each process multiplexes many in-flight
+# requests as greenlets while they wait
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_connections = 1000
+
+# Streamed /chat responses can take a while to finish
+timeout = 120
+
+# Per-request access logging lives here rather than in the Flask views
+accesslog = "-"
\ No newline at end of file
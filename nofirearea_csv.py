@@ -2,14 +2,17 @@
 
 import pandas as pd
 import numpy as np
+import logging
+import os
 from datetime import datetime, timedelta
-import random
-import math
+from sklearn.neighbors import BallTree
+from numerics import EARTH_RADIUS_KM, MAX_LAT, MAX_LON, MIN_LAT, MIN_LON, haversine_matrix
 
 # === CONFIG ===
 INPUT_FILE = "subset.xlsx"  # Your fire incident data
 FIRE_ARCHIVE_CSV = "fire_archive_M-C61_641811.csv"  # Local fire archive
-OUTPUT_FILE = "fire_points_check_10_rows.xlsx"  # Output with 5 points per fire
+OUTPUT_FILE = "fire_points_check_10_rows.parquet"  # Output with 5 points per fire
+WRITE_LEGACY_XLSX = False  # Also write an .xlsx copy of the output
 
 # Sampling parameters
 POINTS_PER_FIRE = 5  # 5 random points per fire incident
@@ -18,12 +21,27 @@ MIN_DISTANCE_KM = 2   # Minimum 2km away from fire point
 FIRE_DETECTION_BUFFER_KM = 1.0  # Consider fire detected if within 1km
 DATE_RANGE_DAYS = 3   # Check ±3 days around fire date
 MAX_ROWS_TO_PROCESS = 10  # Process only first 10 rows for testing
+OVERSAMPLE = 4  # Candidates drawn per needed point before the bounds check
+
+RNG = np.random.default_rng()
+
+# Per-fire and per-point details are logged at DEBUG; set LOG_LEVEL=DEBUG to see them
+logger = logging.getLogger(__name__)
+
+def read_table(path):
+    """Read a parquet, CSV or Excel file based on its extension"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        return pd.read_parquet(path)
+    if ext == ".csv":
+        return pd.read_csv(path)
+    return pd.read_excel(path)
 
 def load_fire_archive():
     """Load and prepare fire archive data"""
     print("📖 Loading fire archive data...")
     try:
-        fire_archive = pd.read_csv(FIRE_ARCHIVE_CSV)
+        fire_archive = read_table(FIRE_ARCHIVE_CSV)
         
         # Convert date column to datetime
         fire_archive['acq_date'] = pd.to_datetime(fire_archive['acq_date'])
@@ -31,83 +49,77 @@ def load_fire_archive():
         print(f"📊 Loaded {len(fire_archive)} fire records from archive")
         print(f"📅 Date range: {fire_archive['acq_date'].min()} to {fire_archive['acq_date'].max()}")
         
-        return fire_archive
+        # Sorted date index; build_archive_trees groups it by day
+        return fire_archive.set_index('acq_date').sort_index()
     except Exception as e:
         print(f"❌ Error loading fire archive: {e}")
         return None
 
-def generate_random_point_in_buffer(center_lat, center_lon, min_distance_km, max_distance_km):
-    """Generate a random point within buffer zone but outside minimum distance"""
-    while True:
-        # Generate random angle and distance
-        angle = random.uniform(0, 2 * math.pi)
-        distance = random.uniform(min_distance_km, max_distance_km)
-        
-        # Calculate new coordinates using proper spherical geometry
-        # Convert distance to degrees (approximate)
-        lat_offset = (distance / 111.0) * math.cos(angle)  # 111 km per degree latitude
-        lon_offset = (distance / (111.0 * math.cos(math.radians(center_lat)))) * math.sin(angle)
-        
-        new_lat = center_lat + lat_offset
-        new_lon = center_lon + lon_offset
-        
-        # Validate coordinates (bounds check for Nepal/region)
-        if 26.0 <= new_lat <= 31.0 and 80.0 <= new_lon <= 89.0:
-            return new_lat, new_lon
-
-def calculate_distance_km(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in kilometers using Haversine formula"""
-    # Convert to radians
-    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+def generate_random_points_in_buffer(center_lat, center_lon, min_distance_km, max_distance_km, count=POINTS_PER_FIRE):
+    """Generate `count` random points within buffer zone but outside minimum distance"""
+    lats, lons = [], []
+    found = 0
+    while found < count:
+        # Draw a batch of random angles and distances at once; taking the square
+        # root spreads points uniformly over the ring's area instead of
+        # crowding them near the inner edge
+        size = count * OVERSAMPLE
+        angles = RNG.uniform(0, 2 * np.pi, size=size)
+        distances = np.sqrt(RNG.random(size) * (max_distance_km**2 - min_distance_km**2) + min_distance_km**2)
+        
+        # Convert distance to degrees (111 km per degree latitude)
+        new_lats = center_lat + (distances / 111.0) * np.cos(angles)
+        new_lons = center_lon + (distances / (111.0 * np.cos(np.radians(center_lat)))) * np.sin(angles)
+        
+        # Keep the candidates inside the bounds for Nepal/region
+        mask = (new_lats >= MIN_LAT) & (new_lats <= MAX_LAT) & (new_lons >= MIN_LON) & (new_lons <= MAX_LON)
+        lats.append(new_lats[mask])
+        lons.append(new_lons[mask])
+        found += int(mask.sum())
     
-    # Haversine formula
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-    c = 2 * math.asin(math.sqrt(a))
-    r = 6371  # Radius of earth in kilometers
-    return c * r
+    return np.concatenate(lats)[:count], np.concatenate(lons)[:count]
 
-def check_fire_in_archive(fire_archive, lat, lon, date, buffer_km=FIRE_DETECTION_BUFFER_KM, date_range_days=DATE_RANGE_DAYS):
-    """Check if fire occurred near this location and date in the archive"""
+def build_archive_trees(fire_archive):
+    """Build one haversine BallTree per archive day, keyed by date"""
+    return {
+        day.date(): BallTree(np.radians(group[['latitude', 'longitude']].to_numpy(dtype=float)), metric='haversine')
+        for day, group in fire_archive.groupby(fire_archive.index.normalize())
+    }
+
+def check_fire_in_archive(archive_trees, lats, lons, date, buffer_km=FIRE_DETECTION_BUFFER_KM, date_range_days=DATE_RANGE_DAYS):
+    """Check each point for fire nearby in the archive around this date; returns (has_fire, min_distance) arrays"""
+    count = len(lats)
     try:
-        # Create date range for checking
-        start_date = date - timedelta(days=date_range_days)
-        end_date = date + timedelta(days=date_range_days)
-        
-        # Filter archive by date range
-        date_filtered = fire_archive[
-            (fire_archive['acq_date'] >= start_date) & 
-            (fire_archive['acq_date'] <= end_date)
-        ]
-        
-        if len(date_filtered) == 0:
-            return False, 0  # No fires in date range
-        
-        # Check spatial proximity
-        fire_found = False
-        min_distance = float('inf')
+        points = np.radians(np.column_stack([lats, lons]))
+        min_distances = np.full(count, np.inf)
+        found_any_day = False
+        
+        # Nearest archive fire for each point, across every day in the date range
+        day = pd.Timestamp(date).date()
+        for offset in range(-date_range_days, date_range_days + 1):
+            tree = archive_trees.get(day + timedelta(days=offset))
+            if tree is None:
+                continue
+            found_any_day = True
+            nearest, _ = tree.query(points, k=1)
+            np.minimum(min_distances, nearest[:, 0] * EARTH_RADIUS_KM, out=min_distances)
         
-        for _, fire_record in date_filtered.iterrows():
-            distance = calculate_distance_km(lat, lon, fire_record['latitude'], fire_record['longitude'])
-            min_distance = min(min_distance, distance)
-            
-            if distance <= buffer_km:
-                fire_found = True
-                break
+        if not found_any_day:
+            return np.zeros(count, dtype=bool), np.zeros(count)  # No fires in date range
         
-        return fire_found, min_distance if min_distance != float('inf') else 999
+        # A fire is within the buffer exactly when the nearest one is
+        return min_distances <= buffer_km, min_distances
         
     except Exception as e:
-        print(f"   ⚠️  Error checking archive: {e}")
-        return False, 999
+        logger.warning(f"⚠️  Error checking archive: {e}")
+        return np.zeros(count, dtype=bool), np.full(count, 999.0)
 
 def generate_points_for_fires():
     """Generate random points around fire locations and check for fire presence"""
     try:
         # Load data
         print("📖 Loading fire incident data...")
-        fire_df = pd.read_excel(INPUT_FILE)
+        fire_df = read_table(INPUT_FILE)
         
         # Take only first MAX_ROWS_TO_PROCESS rows for testing
         fire_df = fire_df.head(MAX_ROWS_TO_PROCESS)
@@ -115,89 +127,95 @@ def generate_points_for_fires():
         fire_archive = load_fire_archive()
         if fire_archive is None:
             return
+        archive_trees = build_archive_trees(fire_archive)
         
         print(f"🔢 Processing {len(fire_df)} fire incidents")
         print(f"🎯 Generating {POINTS_PER_FIRE} random points per fire")
         print("=" * 80)
         
-        results = []
-        
-        for index, fire_row in fire_df.iterrows():
+        # Results are filled into one preallocated array per column (points
+        # as a second axis) and turned into a DataFrame once at the end
+        n_fires = len(fire_df)
+        fire_lats = fire_df['LATITUDE'].to_numpy(dtype=float)
+        fire_lons = fire_df['LONGITUDE'].to_numpy(dtype=float)
+        fire_dates = pd.to_datetime(fire_df['ACQ_DATE'])
+        districts = fire_df['DISTRICT'].to_numpy(dtype=object) if 'DISTRICT' in fire_df else np.full(n_fires, 'Unknown', dtype=object)
+        
+        processed = np.zeros(n_fires, dtype=bool)
+        point_lats = np.empty((n_fires, POINTS_PER_FIRE))
+        point_lons = np.empty((n_fires, POINTS_PER_FIRE))
+        point_fires = np.zeros((n_fires, POINTS_PER_FIRE), dtype=bool)
+        point_distances = np.empty((n_fires, POINTS_PER_FIRE))
+        point_nearest = np.empty((n_fires, POINTS_PER_FIRE))
+        
+        for i in range(n_fires):
             try:
-                fire_lat = fire_row['LATITUDE']
-                fire_lon = fire_row['LONGITUDE']
-                fire_date = pd.to_datetime(fire_row['ACQ_DATE'])
-                district = fire_row.get('DISTRICT', 'Unknown')
+                fire_lat = fire_lats[i]
+                fire_lon = fire_lons[i]
+                fire_date = fire_dates.iloc[i]
+                
+                logger.debug("🔥 Fire %d/%d: %s at %.5f, %.5f on %s", i + 1, n_fires, districts[i], fire_lat, fire_lon, fire_date.date())
                 
-                print(f"\n🔥 Fire {index + 1}/{len(fire_df)}: {district}")
-                print(f"   📍 Fire location: {fire_lat:.5f}, {fire_lon:.5f}")
-                print(f"   📅 Fire date: {fire_date.date()}")
+                # Generate all random points in the buffer zone at once
+                sample_lats, sample_lons = generate_random_points_in_buffer(
+                    fire_lat, fire_lon, MIN_DISTANCE_KM, BUFFER_RADIUS_KM
+                )
                 
-                # Generate result row starting with fire info
-                result_row = {
-                    'fire_id': index + 1,
-                    'fire_latitude': fire_lat,
-                    'fire_longitude': fire_lon,
-                    'fire_date': fire_date,
-                    'district': district
-                }
+                # Check all points against the archive in one pass
+                has_fires, min_distances = check_fire_in_archive(
+                    archive_trees, sample_lats, sample_lons, fire_date
+                )
                 
-                # Generate 5 random points
-                for point_num in range(1, POINTS_PER_FIRE + 1):
-                    print(f"   🎲 Generating point {point_num}...")
-                    
-                    # Generate random point in buffer zone
-                    sample_lat, sample_lon = generate_random_point_in_buffer(
-                        fire_lat, fire_lon, MIN_DISTANCE_KM, BUFFER_RADIUS_KM
-                    )
-                    
-                    # Check if fire occurred at this location
-                    has_fire, min_distance = check_fire_in_archive(
-                        fire_archive, sample_lat, sample_lon, fire_date
-                    )
-                    
-                    # Distance from original fire
-                    distance_from_fire = calculate_distance_km(fire_lat, fire_lon, sample_lat, sample_lon)
-                    
-                    # Add to result row
-                    result_row[f'point_{point_num}_lat'] = sample_lat
-                    result_row[f'point_{point_num}_lon'] = sample_lon
-                    result_row[f'point_{point_num}_fire'] = 'yes' if has_fire else 'no'
-                    result_row[f'point_{point_num}_distance_from_fire_km'] = round(distance_from_fire, 2)
-                    result_row[f'point_{point_num}_nearest_fire_km'] = round(min_distance, 2) if min_distance != 999 else 'none'
-                    
-                    fire_status = "🔥 FIRE" if has_fire else "❄️ NO FIRE"
-                    print(f"      📍 Point {point_num}: {sample_lat:.5f}, {sample_lon:.5f}")
-                    print(f"      📏 {distance_from_fire:.2f}km from original fire")
-                    print(f"      🎯 Status: {fire_status}")
-                    if has_fire:
-                        print(f"      📍 Nearest fire: {min_distance:.2f}km away")
+                # Distance from original fire
+                distances_from_fire = haversine_matrix(fire_lat, fire_lon, sample_lats, sample_lons)
                 
-                results.append(result_row)
+                point_lats[i] = sample_lats
+                point_lons[i] = sample_lons
+                point_fires[i] = has_fires
+                point_distances[i] = distances_from_fire
+                point_nearest[i] = min_distances
+                processed[i] = True
+                
+                if logger.isEnabledFor(logging.DEBUG):
+                    for point_num in range(1, POINTS_PER_FIRE + 1):
+                        k = point_num - 1
+                        fire_status = "🔥 FIRE" if has_fires[k] else "❄️ NO FIRE"
+                        logger.debug(f"   📍 Point {point_num}: {sample_lats[k]:.5f}, {sample_lons[k]:.5f}, {distances_from_fire[k]:.2f}km from original fire, {fire_status}, nearest fire {min_distances[k]:.2f}km")
                 
             except Exception as e:
-                print(f"   ❌ Error processing fire {index + 1}: {e}")
+                logger.warning(f"❌ Error processing fire {i + 1}: {e}")
                 continue
         
-        # Create DataFrame and save
-        results_df = pd.DataFrame(results)
-        results_df.to_excel(OUTPUT_FILE, index=False)
+        # Create DataFrame from the processed rows and save
+        columns = {
+            'fire_id': np.arange(1, n_fires + 1)[processed],
+            'fire_latitude': fire_lats[processed],
+            'fire_longitude': fire_lons[processed],
+            'fire_date': fire_dates.to_numpy()[processed],
+            'district': districts[processed]
+        }
+        nearest_km = np.where(point_nearest == 999, np.nan, np.round(point_nearest, 2))
+        for k in range(POINTS_PER_FIRE):
+            point_num = k + 1
+            columns[f'point_{point_num}_lat'] = point_lats[processed, k]
+            columns[f'point_{point_num}_lon'] = point_lons[processed, k]
+            columns[f'point_{point_num}_fire'] = np.where(point_fires[processed, k], 'yes', 'no').astype(object)
+            columns[f'point_{point_num}_distance_from_fire_km'] = np.round(point_distances[processed, k], 2)
+            columns[f'point_{point_num}_nearest_fire_km'] = nearest_km[processed, k]
+        results_df = pd.DataFrame(columns, copy=False)
+        results_df.to_parquet(OUTPUT_FILE, engine='pyarrow', compression='zstd', index=False)
+        if WRITE_LEGACY_XLSX:
+            results_df.to_excel(os.path.splitext(OUTPUT_FILE)[0] + ".xlsx", index=False)
         
         # Summary statistics
-        total_points = len(results) * POINTS_PER_FIRE
-        fire_points = 0
-        no_fire_points = 0
-        
-        for point_num in range(1, POINTS_PER_FIRE + 1):
-            fire_count = len(results_df[results_df[f'point_{point_num}_fire'] == 'yes'])
-            fire_points += fire_count
-        
+        total_points = int(processed.sum()) * POINTS_PER_FIRE
+        fire_points = int(point_fires[processed].sum())
         no_fire_points = total_points - fire_points
         
         print("\n" + "=" * 80)
         print("🎉 Point generation complete!")
         print(f"📊 Summary statistics:")
-        print(f"   🔥 Total fires processed: {len(results)}")
+        print(f"   🔥 Total fires processed: {int(processed.sum())}")
         print(f"   📍 Total points generated: {total_points}")
         print(f"   🔥 Points with fire detected: {fire_points}")
         print(f"   ❄️  Points with NO fire: {no_fire_points}")
@@ -223,6 +241,7 @@ def generate_points_for_fires():
 
 # === MAIN EXECUTION ===
 if __name__ == "__main__":
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"), format="%(message)s")
     print("🎯 Fire Point Generation and Validation")
     print("📊 Using Local CSV Fire Archive for Validation")
     print("🧪 Processing First 10 Fires for Testing")
@@ -0,0 +1,17 @@
+# Vectorized great-circle distance helpers for the point generation scripts
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Bounds check for Nepal/region
+MIN_LAT, MAX_LAT = 26.0, 31.0
+MIN_LON, MAX_LON = 80.0, 89.0
+
+def haversine_matrix(lats1, lons1, lats2, lons2):
+    """Haversine distances in km between two sets of points, broadcasting like NumPy"""
+    lats1, lons1, lats2, lons2 = np.radians(lats1), np.radians(lons1), np.radians(lats2), np.radians(lons2)
+    dlat = lats2 - lats1
+    dlon = lons2 - lons1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lats1) * np.cos(lats2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
@@ -0,0 +1,2 @@
+from .batching import Batcher
+from .serialization import JSONDecodeError, dumps, loads
\ No newline at end of file
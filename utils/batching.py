@@ -0,0 +1,68 @@
+# Micro-batching shared by the prediction and sensor write paths: callers
+# submit single items from any thread and a background thread processes
+# them together.
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class Batcher:
+    """
+    Collects items from concurrent callers and passes them to _process in
+    batches on a background thread. A batch is closed once max_batch items
+    are queued or timeout seconds after its first item arrived.
+
+    submit() returns a Future that _process resolves for that item.
+    """
+
+    thread_name = "batcher"
+
+    def __init__(self, max_batch, timeout):
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item):
+        """Queue one item for the next batch"""
+        self._ensure_started()
+        future = Future()
+        self.queue.put((item, future))
+        return future
+
+    def _ensure_started(self):
+        # Start lazily so forked server workers each get their own thread
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name=self.thread_name, daemon=True
+                    )
+                    self._thread.start()
+
+    def _setup(self):
+        """Build state owned by the batching thread, passed to every _process call"""
+        return None
+
+    def _run(self):
+        state = self._setup()
+        while True:
+            batch = [self.queue.get()]
+            # Bound the wait from the first item so a steady trickle of
+            # submissions cannot keep the batch open
+            deadline = time.monotonic() + self.timeout
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._process(batch, state)
+
+    def _process(self, batch, state):
+        """Handle a list of (item, future) pairs, resolving every future"""
+        raise NotImplementedError
\ No newline at end of file
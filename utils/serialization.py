@@ -0,0 +1,17 @@
+# JSON for request bodies and cached documents: orjson when it is installed,
+# the standard library otherwise. loads accepts bytes and raises a subclass
+# of ValueError on malformed input; dumps returns bytes.
+try:
+    import orjson
+
+    loads = orjson.loads
+    dumps = orjson.dumps
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    import json
+
+    loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+    def dumps(obj):
+        return json.dumps(obj).encode("utf-8")
\ No newline at end of file